@@ -1,137 +1,784 @@
-from flask import Flask, render_template, jsonify, request
-from flask_socketio import SocketIO, emit
-import json, os, threading
+try:
+    # green threads: one process holds thousands of sockets; must patch before anything imports threading/socket
+    import eventlet
+    eventlet.monkey_patch()
+    ASYNC_MODE = "eventlet"
+except ImportError:
+    ASYNC_MODE = "threading"
+
+from flask import Flask, Response, render_template, jsonify, request
+from flask_socketio import SocketIO, emit, join_room, leave_room, rooms
+import orjson
+import atexit, hashlib, json, os, threading, time
 from pathlib import Path
 
-from copy import deepcopy
+from readerwriterlock import rwlock
 
 def _flow_root_title(flow):
-    by_title = {n["title"]: n for n in flow}
+    # one pass: roots holds, in order, the titles nothing has referenced so far
     referenced = set()
+    roots = {}
+    has_start = False
     for n in flow:
+        t = n["title"]
+        has_start = has_start or t == "START"
+        if t not in referenced:
+            roots.setdefault(t)
         for e in n.get("next", []):
             tgt = e.get("next") if isinstance(e, dict) else e
-            if tgt: referenced.add(tgt)
-    if "START" in by_title:
+            if tgt:
+                referenced.add(tgt)
+                roots.pop(tgt, None)
+    if has_start:
         return "START"
-    for t in by_title:
-        if t not in referenced:
-            return t
-    return flow[0]["title"]  # fallback
+    return next(iter(roots), flow[0]["title"])  # fallback
 
 def _flow_to_children(flow):
     """Convert array-of-nodes with .next[label,next:title] into nested children tree."""
     by_title = {n["title"]: n for n in flow}
     root_title = _flow_root_title(flow)
 
-    def build(title, seen):
+    def make(title, label):
         src = by_title.get(title)
         if not src:
             # missing reference; make a stub
-            return {"id": f"missing:{title}", "title": title, "description": "", "children": []}
-
-        node = {
-            "id": src.get("id", title),
-            "title": src.get("title", title),
-            "description": src.get("description", ""),
-            "children": []
-        }
-        if title in seen:
-            # cycle guard: return node without expanding children
-            return node
-
-        seen = seen | {title}
-        for edge in src.get("next", []):
-            tgt_title = edge["next"] if isinstance(edge, dict) else edge
-            child = build(tgt_title, seen)
-            if isinstance(edge, dict) and "label" in edge:
-                # keep edge label on the child so we can round-trip it later
-                child["edgeLabel"] = edge["label"]
-            node["children"].append(child)
+            node = {"id": f"missing:{title}", "title": title, "description": "", "children": []}
+        else:
+            node = {
+                "id": src.get("id", title),
+                "title": src.get("title", title),
+                "description": src.get("description", ""),
+                "children": []
+            }
+        if label is not None:
+            # keep edge label on the child so we can round-trip it later
+            node["edgeLabel"] = label
         return node
 
-    return build(root_title, set())
+    root = make(root_title, None)
+    count = 1
+    # title -> (children, node count) of subtrees built without hitting the cycle guard; those
+    # don't depend on the path they were built under, so later references share them
+    memo = {}
+    # titles of the frames on the stack, i.e. the current path; a title already on it is a cycle
+    on_path = set()
+    # frames: [title, iterator over its remaining edges, children list of its node, node count, cut by the cycle guard]
+    stack = []
+    done = object()
+    if root_title in by_title:
+        on_path.add(root_title)
+        stack.append([root_title, iter(by_title[root_title].get("next", [])), root["children"], 1, False])
+    while stack:
+        frame = stack[-1]
+        title, edges, children = frame[0], frame[1], frame[2]
+        edge = next(edges, done)
+        if edge is done:
+            stack.pop()
+            on_path.remove(title)
+            if not frame[4]:
+                memo[title] = (children, frame[3])
+            if stack:
+                stack[-1][3] += frame[3]
+                stack[-1][4] = stack[-1][4] or frame[4]
+            continue
+        tgt_title = edge["next"] if isinstance(edge, dict) else edge
+        child = make(tgt_title, edge["label"] if isinstance(edge, dict) and "label" in edge else None)
+        children.append(child)
+        size = 1
+        if tgt_title in memo:
+            child["children"], size = memo[tgt_title]
+        elif tgt_title in on_path:
+            # cycle guard: keep the node but don't expand its children
+            frame[4] = True
+        elif tgt_title in by_title:
+            on_path.add(tgt_title)
+            stack.append([tgt_title, iter(by_title[tgt_title].get("next", [])), child["children"], 1, False])
+            frame[3] -= 1  # the child's frame adds its whole count when it pops
+        frame[3] += size
+        count += size
+        if count > MAX_NODES:
+            # shared subflows are repeated per parent, so a small flow can expand into a huge tree
+            raise ValueError(f"tree.json expands to more than {MAX_NODES} nodes")
+
+    return root
+
+def _intern_subtrees(root):
+    """
+    Make identical subtrees share one dict, bottom-up. _flow_to_children makes a
+    node per reference to a shared subflow; this folds identical ones together.
+    Nodes with unhashable field values are left alone.
+    """
+    memo = {}    # (fields, child identities) -> canonical node
+    canon = {}   # id(node) -> (node, canonical node); holding node keeps its id from being reused
+    stack = [(root, False)]
+    while stack:
+        node, children_done = stack.pop()
+        if id(node) in canon:
+            continue
+        children = node.get("children", [])
+        if not children_done:
+            stack.append((node, True))
+            stack.extend((c, False) for c in children)
+            continue
+        node["children"] = children = [canon[id(c)][1] for c in children]
+        try:
+            key = (tuple((k, v) for k, v in node.items() if k != "children"),
+                   tuple(id(c) for c in children))
+            canon[id(node)] = (node, memo.setdefault(key, node))
+        except TypeError:
+            canon[id(node)] = (node, node)
+    return canon[id(root)][1]
 
-def _children_to_flow(tree):
-    """Convert nested children tree back to array-of-nodes with .next[label,next:title]."""
+def _children_to_flow(index):
+    """Convert the indexed children tree (see _build_index) back to array-of-nodes with .next[label,next:title]."""
+    tree_nodes, parent = index["nodes"], index["parent"]
+    first_child, next_sibling = index["first_child"], index["next_sibling"]
     nodes = {}
+    expanded = set()  # titles whose first position's children became their edges
 
-    def ensure_node(n):
+    # pre-order walk over the child/sibling arrays, so nodes (and their edges) come out in the same order as before
+    i = 0
+    while True:
+        n = tree_nodes[i]
         t = n.get("title", "")
-        nid = n.get("id") or t
         if t not in nodes:
-            nodes[t] = {"id": nid, "title": t, "description": n.get("description", ""), "next": []}
-
-    def walk(n):
-        ensure_node(n)
-        for c in n.get("children", []):
-            ensure_node(c)
-            # push an edge from n to c by *title*, with the label we carried
-            nodes[n["title"]]["next"].append({
-                "label": c.get("edgeLabel", ""),
-                "next": c.get("title", "")
+            nodes[t] = {"id": n.get("id") or t, "title": t, "description": n.get("description", ""), "next": []}
+        if parent[i] != -1:
+            # push an edge from parent to n by *title*, with the label we carried
+            nodes[tree_nodes[parent[i]]["title"]]["next"].append({
+                "label": n.get("edgeLabel", ""),
+                "next": t
             })
-            walk(c)
+        # a title reached again (shared subflow) already has its edges; adding them again would duplicate them
+        descend = t not in expanded
+        expanded.add(t)
+        if descend and first_child[i] != -1:
+            i = first_child[i]
+            continue
+        while i != 0 and next_sibling[i] == -1:
+            i = parent[i]
+        if i == 0:
+            break
+        i = next_sibling[i]
 
-    walk(tree)
     # return as a list, preserving at least root first
-    root_first = [nodes[tree["title"]]] + [v for k, v in nodes.items() if k != tree["title"]]
+    root_title = tree_nodes[0]["title"]
+    root_first = [nodes[root_title]] + [v for k, v in nodes.items() if k != root_title]
     return root_first
 
+def _edge_target(edge):
+    return edge["next"] if isinstance(edge, dict) else edge
+
+def _flow_refs(flow):
+    """Incoming edge count per title, for a {title: flow node} dict."""
+    refs = {}
+    for n in flow.values():
+        for e in n.get("next", []):
+            t = _edge_target(e)
+            refs[t] = refs.get(t, 0) + 1
+    return refs
+
+def _titles_unique(index):
+    """True if no title appears twice in the tree (no shared subflows, cycle guards or merged titles)."""
+    seen = set()
+    for i in _preorder(index):
+        t = index["nodes"][i]["title"]
+        if t in seen:
+            return False
+        seen.add(t)
+    return True
+
+def _patch_flow(flow, refs, root_title, index, ops):
+    """
+    Apply the handlers' JSON-Patch ops to the {title: flow node} dict in place,
+    so a save doesn't have to rebuild the flow from the whole tree.
+
+    Only valid while the tree's titles are unique, so that every tree node is
+    exactly one flow node and its children line up 1:1 with that node's edges.
+    `index` is the index of the tree *before* the ops. Returns False when an
+    op would break that (e.g. a title collision); the caller then rebuilds the
+    flow with _children_to_flow.
+    """
+    def aligned(node):
+        entry = flow.get(node["title"])
+        if entry is None or len(entry.get("next", [])) != len(node.get("children", [])):
+            return None
+        return entry
+
+    renamed = {}
+    for op in ops:
+        node_id, rest = _parse_patch_path(op["path"])
+        node, parent = find_node(index, node_id)
+        if node is None:
+            return False
+
+        if op["op"] == "add":
+            entry = aligned(node)
+            child = op["value"]
+            t = child["title"]
+            if entry is None or t in flow:
+                return False
+            entry.setdefault("next", []).append({"label": child.get("edgeLabel", ""), "next": t})
+            refs[t] = 1
+            flow[t] = {"id": child.get("id") or t, "title": t,
+                       "description": child.get("description", ""), "next": []}
+
+        elif op["op"] == "replace" and rest == ("description",):
+            entry = flow.get(renamed.get(node["title"], node["title"]))
+            if entry is None:
+                return False
+            entry["description"] = op["value"]
+
+        elif op["op"] == "replace" and rest == ("title",):
+            old, new = node["title"], op["value"]
+            if new == old:
+                continue
+            entry = flow.get(old)
+            # any other edge into `old` (e.g. from an unreachable flow node) would be left dangling
+            if entry is None or new in flow or refs.get(old, 0) != (parent is not None):
+                return False
+            if parent is not None:
+                pentry = aligned(parent)
+                if pentry is None:
+                    return False
+                i = next(i for i, c in enumerate(parent["children"]) if c is node)
+                edge = pentry["next"][i]
+                if isinstance(edge, dict):
+                    edge["next"] = new
+                else:
+                    pentry["next"][i] = new
+                refs[new] = refs.pop(old)
+            entry["title"] = new
+            flow[new] = flow.pop(old)
+            renamed[old] = new
+
+        elif op["op"] == "remove" and not rest:
+            pentry = aligned(parent) if parent is not None else None
+            if pentry is None:
+                return False
+            gone = {i for i, c in enumerate(parent["children"]) if c["id"] == node_id}
+            stack = [_edge_target(e) for i, e in enumerate(pentry["next"]) if i in gone]
+            pentry["next"] = [e for i, e in enumerate(pentry["next"]) if i not in gone]
+            # drop the titles that were only reachable through the removed node
+            while stack:
+                t = stack.pop()
+                refs[t] -= 1
+                if refs[t] or t == root_title:
+                    # something else still points here (an unreachable flow node); let a rebuild decide
+                    return False
+                del refs[t]
+                for e in flow.pop(t, {}).get("next", []):
+                    stack.append(_edge_target(e))
+
+        else:
+            return False
+    return True
+
+def _dumps(obj):
+    """orjson.dumps, falling back to the stdlib json for data nested deeper than orjson allows."""
+    try:
+        return orjson.dumps(obj)
+    except TypeError:
+        # orjson stops at 255 levels, and each tree level takes two (node dict + children list)
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode()
+
+class RawJSON(str):
+    """A str that is already encoded JSON; spliced into Socket.IO packets as-is."""
+
+class _SocketJSON:
+    """orjson-backed json module for Socket.IO that passes RawJSON args through untouched."""
+
+    @staticmethod
+    def dumps(obj, **kwargs):
+        # Socket.IO event packets encode [event, *args]; only those need the splice
+        if isinstance(obj, list) and any(isinstance(x, RawJSON) for x in obj):
+            return "[" + ",".join(
+                x if isinstance(x, RawJSON) else _dumps(x).decode() for x in obj
+            ) + "]"
+        return _dumps(obj).decode()
+
+    @staticmethod
+    def loads(s, **kwargs):
+        return orjson.loads(s)
+
 
 APP_DIR = Path(__file__).parent
 DATA_FILE = APP_DIR / "tree.json"
 
 app = Flask(__name__)
 app.config["SECRET_KEY"] = "dev"
-socketio = SocketIO(app, cors_allowed_origins="*")
+# Limits on untrusted input; anything over them is rejected with 413
+MAX_BODY_BYTES = 64 * 1024
+MAX_NODES = 10_000
+# nodes on a root-to-leaf path; keeps mutation responses ({"ok", "tree"}) within orjson's 255 levels
+MAX_DEPTH = 120
+MAX_TITLE_LEN = 512
+# werkzeug refuses larger bodies (by Content-Length, or while streaming) before we parse them
+app.config["MAX_CONTENT_LENGTH"] = MAX_BODY_BYTES
+# eventlet's websocket server negotiates permessage-deflate with the browser on its own;
+# long-polling responses are compressed by engine.io (http_compression)
+socketio = SocketIO(app, async_mode=ASYNC_MODE, cors_allowed_origins="*", json=_SocketJSON)
 
-_file_lock = threading.Lock()
+# Above this many clients, broadcasts go out in batches with a yield in between
+BROADCAST_BATCH_SIZE = 50
+# Mutations within this many seconds of each other share one tree_patch
+BROADCAST_DEBOUNCE = 0.05
+# Saves within this many seconds of each other share one write of tree.json
+PERSIST_DELAY = 0.05
+# Failed writes are retried with doubling delays, capped here
+PERSIST_RETRY_MAX = 5.0
 
-def load_tree():
-    with _file_lock:
-        if not DATA_FILE.exists():
-            # If missing, seed with a minimal flow that matches your file format
-            seed = [{
-                "id": "root-seed",
-                "title": "START",
-                "description": "Start",
-                "next": []
-            }]
-            DATA_FILE.write_text(json.dumps(seed, indent=2))
-
-        raw = json.loads(DATA_FILE.read_text())
+# Readers of tree.json share _rw, writers take it exclusively; _cache itself is only
+# ever touched under the (much cheaper) _cache_lock, so cache hits never wait on the RW lock
+_rw = rwlock.RWLockFair()
+_cache_lock = threading.Lock()
+# set when _cache["tree"] is newer than tree.json; the writer thread clears it
+_dirty = threading.Event()
+_broadcast_lock = threading.Lock()
+# held by mutating endpoints from load_tree_mut through save_tree, so an edit always
+# starts from the tree the previous one saved
+_mutation_lock = threading.Lock()
+_pending_broadcast = {"scheduled": False, "base": 0, "version": 0, "changes": []}
+# room -> version its last tree_patch brought it to; rooms only see the versions that touched them.
+# Only occupied rooms are kept
+_room_version = {}
+# Parsed tree for the current tree.json, keyed on its mtime/size so reads skip re-parsing
+# version counts cache replacements, so clients can tell whether a tree_patch applies to their copy
+# flow is the {title: flow node} form written to tree.json, kept in step with tree by save_tree
+# (patched in place while flow_exact, i.e. the tree's titles are unique; rebuilt otherwise);
+# refs counts incoming edges per title so deletes can drop orphaned titles;
+# hash is the digest of tree.json's bytes, so writes that wouldn't change it are skipped
+_cache = {"mtime": 0, "size": 0, "tree": None, "index": None, "encoded": None, "version": 0,
+          "flow": None, "refs": None, "flow_exact": False, "hash": None}
+
+def _build_index(root):
+    """
+    Child/sibling arrays over the tree, one slot per position in pre-order
+    (root is 0, -1 means none). nodes[i] is the dict at position i, which stays
+    the API's view; internal walks go over the int arrays instead. by_id maps
+    a node id to its first position, like a DFS search would find it.
+    """
+    nodes, parent, first_child, next_sibling, last_child = [], [], [], [], []
+    by_id = {}
+    stack = [(root, -1)]
+    while stack:
+        node, p = stack.pop()
+        i = len(nodes)
+        nodes.append(node)
+        parent.append(p)
+        first_child.append(-1)
+        next_sibling.append(-1)
+        last_child.append(-1)
+        by_id.setdefault(node["id"], i)
+        if p != -1:
+            if last_child[p] == -1:
+                first_child[p] = i
+            else:
+                next_sibling[last_child[p]] = i
+            last_child[p] = i
+        stack.extend((child, i) for child in reversed(node.get("children", [])))
+    return {"nodes": nodes, "by_id": by_id, "parent": parent, "first_child": first_child,
+            "next_sibling": next_sibling, "last_child": last_child, "dead": 0}
+
+def _preorder(index, start=0):
+    """Positions of start's subtree in pre-order, walked on the child/sibling arrays."""
+    parent, first_child, next_sibling = index["parent"], index["first_child"], index["next_sibling"]
+    i = start
+    while True:
+        yield i
+        if first_child[i] != -1:
+            i = first_child[i]
+            continue
+        while i != start and next_sibling[i] == -1:
+            i = parent[i]
+        if i == start:
+            return
+        i = next_sibling[i]
+
+def _tree_depth(index):
+    """Nodes on the longest root-to-leaf path."""
+    parent = index["parent"]
+    depth = [0] * len(parent)
+    for i in _preorder(index):
+        depth[i] = depth[parent[i]] + 1 if parent[i] != -1 else 1
+    return max(depth)
+
+def _index_add(index, p, node):
+    """Append node as the last child of position p."""
+    i = len(index["nodes"])
+    index["nodes"].append(node)
+    index["parent"].append(p)
+    index["first_child"].append(-1)
+    index["next_sibling"].append(-1)
+    index["last_child"].append(-1)
+    index["by_id"].setdefault(node["id"], i)
+    last = index["last_child"][p]
+    if last == -1:
+        index["first_child"][p] = i
+    else:
+        index["next_sibling"][last] = i
+    index["last_child"][p] = i
+    return i
+
+def _index_remove(index, p, node_id):
+    """
+    Unlink every child of position p with this id. Their slots stay behind,
+    unreachable (counted in "dead"), until save_tree compacts the index.
+    """
+    nodes, by_id = index["nodes"], index["by_id"]
+    first_child, next_sibling, last_child = index["first_child"], index["next_sibling"], index["last_child"]
+    prev, c = -1, first_child[p]
+    while c != -1:
+        nxt = next_sibling[c]
+        if nodes[c]["id"] != node_id:
+            prev = c
+        else:
+            for j in _preorder(index, c):
+                index["dead"] += 1
+                if by_id.get(nodes[j]["id"]) == j:
+                    del by_id[nodes[j]["id"]]
+            if prev == -1:
+                first_child[p] = nxt
+            else:
+                next_sibling[prev] = nxt
+            if last_child[p] == c:
+                last_child[p] = prev
+        c = nxt
+
+def _digest(data):
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+def _replace_data_file(data):
+    """Write tree.json via a temp file + os.replace, so readers and crashes never see half a file."""
+    tmp = DATA_FILE.with_suffix(".json.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, DATA_FILE)
+
+def _cache_hit(st):
+    # caller holds _cache_lock
+    return (st is not None and _cache["tree"] is not None
+            and st.st_mtime_ns == _cache["mtime"] and st.st_size == _cache["size"])
+
+def _load_cached():
+    # fast path: a stat and a dict compare, no RW lock
+    st = DATA_FILE.stat() if DATA_FILE.exists() else None
+    with _cache_lock:
+        if _cache_hit(st):
+            return _cache["tree"], _cache["index"]
+
+    if st is None:
+        with _rw.gen_wlock():
+            if not DATA_FILE.exists():
+                # If missing, seed with a minimal flow that matches your file format
+                seed = [{
+                    "id": "root-seed",
+                    "title": "START",
+                    "description": "Start",
+                    "next": []
+                }]
+                _replace_data_file(orjson.dumps(seed, option=orjson.OPT_INDENT_2))
+
+    with _rw.gen_rlock():
+        st = DATA_FILE.stat()
+        with _cache_lock:
+            if _cache_hit(st):
+                return _cache["tree"], _cache["index"]
+
+        data = DATA_FILE.read_bytes()
+        raw = orjson.loads(data)
         # If file is already a nested dict, just return it; otherwise convert flow → children
         if isinstance(raw, list):
-            return _flow_to_children(raw)
+            tree = _intern_subtrees(_flow_to_children(raw))
+            index = _build_index(tree)
+            flow = {n["title"]: n for n in raw}
         elif isinstance(raw, dict):
-            return raw
+            tree = raw
+            index = _build_index(tree)
+            flow = {n["title"]: n for n in _children_to_flow(index)}
         else:
             raise ValueError("Unsupported tree.json format")
 
-def save_tree(tree):
-    with _file_lock:
-        # Always store as the original flow (array) so your file shape is preserved
-        flow = _children_to_flow(tree)
-        DATA_FILE.write_text(json.dumps(flow, indent=2))
+        with _cache_lock:
+            # another reader may have parsed the same file meanwhile; keep theirs
+            if _cache_hit(st):
+                return _cache["tree"], _cache["index"]
+            _cache.update(mtime=st.st_mtime_ns, size=st.st_size, tree=tree, index=index,
+                          version=_cache["version"] + 1, flow=flow, refs=_flow_refs(flow),
+                          flow_exact=_titles_unique(index), hash=_digest(data))
+        return tree, index
+
+def load_tree():
+    """Return the cached tree; callers must not mutate it (use load_tree_mut for that)."""
+    return _load_cached()[0]
+
+def load_tree_mut(node_id):
+    """
+    Copy-on-write view of the cached tree for a mutating endpoint: the dicts on
+    the path from the root down to node_id are cloned (with their children
+    lists), every other subtree is still shared with the cache, so only that
+    path may be mutated. The index gets its own arrays, with nodes[] pointing at
+    the clones. If node_id isn't in the tree, nothing is cloned.
+    """
+    tree, index = _load_cached()
+    index = {k: v.copy() if k != "dead" else v for k, v in index.items()}
+    nodes, parent = index["nodes"], index["parent"]
+    i = index["by_id"].get(node_id)
+    if i is None:
+        return tree, index
+    # bottom-up: clone each node on the path and hook the clone below it into its children
+    child_old = child_new = None
+    while i != -1:
+        old = nodes[i]
+        new = nodes[i] = dict(old)
+        if "children" in old:
+            new["children"] = children = old["children"].copy()
+            if child_old is not None:
+                # the path goes through the first child that is child_old, as in a pre-order search
+                children[next(k for k, c in enumerate(children) if c is child_old)] = child_new
+        child_old, child_new = old, new
+        i = parent[i]
+    return nodes[0], index
+
+def save_tree(tree, index, ops, notify):
+    """
+    Make the mutated tree current and queue `ops` (the JSON-Patch that produced
+    it) for the `notify` rooms. tree.json is written shortly after by the writer thread.
+    Returns the tree now cached, which is rebuilt from the flow when titles repeat.
+    Raises ValueError (cache untouched) if the tree would exceed MAX_NODES or MAX_DEPTH.
+    """
+    with _cache_lock:
+        flow, refs, exact = _cache["flow"], _cache["refs"], _cache["flow_exact"]
+        if not (exact and _patch_flow(flow, refs, _cache["tree"]["title"], _cache["index"], ops)):
+            flow = {n["title"]: n for n in _children_to_flow(index)}
+            refs = _flow_refs(flow)
+            if not _titles_unique(index):
+                # tree.json keeps one node per title, so an edit made at one occurrence of a shared
+                # subflow applies to all of them; serve what reloading the file would give
+                tree = _intern_subtrees(_flow_to_children(_flow_list(flow, tree["title"])))
+                index = _build_index(tree)
+                # clients hold each occurrence separately, so a patch would only reach one
+                ops = None
+            exact = _titles_unique(index)
+            # the add endpoint checks depth itself; a rebuild can merge subflows into a longer path
+            if _tree_depth(index) > MAX_DEPTH:
+                raise ValueError(f"tree would be more than {MAX_DEPTH} levels deep")
+        if index["dead"] * 2 > len(index["nodes"]):
+            # mostly deleted slots by now; they'd be copied by every load_tree_mut
+            index = _build_index(tree)
+        version = _cache["version"] + 1
+        _cache.update(tree=tree, index=index, version=version, flow=flow, refs=refs, flow_exact=exact)
+        # queued under the cache lock so patches line up with versions
+        schedule_broadcast(ops, notify, version)
+    _dirty.set()
+    return tree
+
+def _flow_list(flow, root_title):
+    """The {title: flow node} form as tree.json's list, root first."""
+    root_first = [flow[root_title]] if root_title in flow else []
+    root_first += [v for k, v in flow.items() if k != root_title]
+    return root_first
+
+def _write_tree():
+    """Write the cached flow to tree.json (atomically) and re-key the cache on the new file."""
+    with _rw.gen_wlock():
+        with _cache_lock:
+            # Always store as the original flow (array) so your file shape is preserved;
+            # encoded under the lock since save_tree patches the flow in place
+            root_first = _flow_list(_cache["flow"], _cache["tree"]["title"])
+            data = orjson.dumps(root_first, option=orjson.OPT_INDENT_2)
+            digest = _digest(data)
+            if digest == _cache["hash"]:
+                # e.g. an edit that set a title to what it already was
+                return
+        _replace_data_file(data)
+        st = DATA_FILE.stat()
+        with _cache_lock:
+            _cache.update(mtime=st.st_mtime_ns, size=st.st_size, hash=digest)
+
+def _writer():
+    backoff = PERSIST_DELAY
+    while True:
+        _dirty.wait()
+        time.sleep(PERSIST_DELAY)  # let a burst of saves land first
+        _dirty.clear()
+        try:
+            _write_tree()
+            backoff = PERSIST_DELAY
+        except Exception:
+            app.logger.exception("writing tree.json failed; retrying in %.2fs", backoff)
+            # still unwritten: keep it dirty (for the retry and the atexit flush)
+            _dirty.set()
+            time.sleep(backoff)
+            backoff = min(backoff * 2, PERSIST_RETRY_MAX)
+
+@atexit.register
+def _flush_tree():
+    # don't lose saves still waiting on the writer
+    if _dirty.is_set():
+        _dirty.clear()
+        _write_tree()
+
+threading.Thread(target=_writer, name="tree-writer", daemon=True).start()
+
+
+def _encoded_tree():
+    """(tree, version, bytes, RawJSON, etag) for the cached tree; encoded once each time the cache is replaced."""
+    load_tree()  # pick up on-disk changes first
+    with _cache_lock:
+        tree, version = _cache["tree"], _cache["version"]
+    enc = _cache["encoded"]
+    if enc is None or enc[0] is not tree:
+        body = _dumps(tree)
+        enc = (tree, version, body, RawJSON(body.decode()), hashlib.blake2b(body, digest_size=16).hexdigest())
+        _cache["encoded"] = enc
+    return enc
+
+def load_tree_json():
+    """(load_tree() as JSON bytes, its etag) for HTTP responses."""
+    _, _, body, _, etag = _encoded_tree()
+    return body, etag
+
+def load_tree_payload():
+    """(pre-encoded tree, version) for tree_updated snapshots."""
+    _, version, _, payload, _ = _encoded_tree()
+    return payload, version
 
+def broadcast(event, *args, room=None):
+    """Emit to every client (or one room), yielding between batches so requests aren't starved."""
+    # a tuple is sent as separate Socket.IO arguments
+    sids = [sid for sid, _ in socketio.server.manager.get_participants("/", room)]
+    if len(sids) <= BROADCAST_BATCH_SIZE:
+        socketio.emit(event, args, to=room)
+        return
+    for i in range(0, len(sids), BROADCAST_BATCH_SIZE):
+        for sid in sids[i:i + BROADCAST_BATCH_SIZE]:
+            socketio.emit(event, args, to=sid)
+        socketio.sleep(0)
 
-def find_node(node, node_id, parent=None):
-    if node["id"] == node_id:
-        return node, parent
-    for child in node.get("children", []):
-        found, p = find_node(child, node_id, node)
-        if found:
-            return found, p
-    return None, None
+def _patch_path(node_id, *rest):
+    """JSON-Pointer to a node addressed by id (clients resolve /byId/<id> against their tree)."""
+    return "/".join(("/byId", node_id.replace("~", "~0").replace("/", "~1")) + rest)
+
+def _parse_patch_path(path):
+    """Inverse of _patch_path: (node_id, rest)."""
+    _, _, node_id, *rest = path.split("/")
+    return node_id.replace("~1", "/").replace("~0", "~"), tuple(rest)
+
+def _ancestor_ids(index, node_id):
+    """node_id followed by its parent chain up to the root -- the rooms that care about a change there."""
+    ids = []
+    i = index["by_id"].get(node_id, -1)
+    while i != -1:
+        ids.append(index["nodes"][i]["id"])
+        i = index["parent"][i]
+    return ids
+
+def _node_room(node_id):
+    """Room of the clients following node_id; prefixed so a node id can't name a client's own sid room."""
+    return f"node:{node_id}"
+
+def _debounced_emit():
+    socketio.sleep(BROADCAST_DEBOUNCE)
+    with _broadcast_lock:
+        pending = dict(_pending_broadcast)
+        _pending_broadcast.update(scheduled=False, changes=[])
+    if pending["changes"] is None:
+        # the versions in this window weren't contiguous; only a snapshot is safe
+        broadcast("tree_updated", *load_tree_payload())
+        return
+    # each room gets the ops under its node, in order, tagged with the version that made them
+    by_room = {}
+    for version, (ops, notify) in enumerate(pending["changes"], pending["base"] + 1):
+        for node_id in notify:
+            by_room.setdefault(_node_room(node_id), []).append([version, ops])
+    # base is the room's previous patch: a client at or past it has every earlier change in that room
+    with _broadcast_lock:
+        bases = {room: _room_version.get(room, 0) for room in by_room}
+        _room_version.update(dict.fromkeys(by_room, pending["version"]))
+        # an empty room needs no base: joining one comes with a fresh snapshot
+        occupied = socketio.server.manager.rooms.get("/", {})
+        for room in [r for r in _room_version if r not in occupied]:
+            del _room_version[room]
+    for room, changes in by_room.items():
+        broadcast("tree_patch", {"base": bases[room], "version": pending["version"], "changes": changes}, room=room)
+
+def schedule_broadcast(ops, notify, version):
+    """
+    Queue the JSON-Patch ops that produced `version` for the `notify` rooms and
+    broadcast them shortly, folding any other mutations in the meantime into
+    the same tree_patch. ops=None sends everyone a snapshot instead.
+    """
+    with _broadcast_lock:
+        if not _pending_broadcast["scheduled"]:
+            _pending_broadcast.update(scheduled=True, base=version - 1, version=version,
+                                      changes=[(ops, notify)] if ops is not None else None)
+            socketio.start_background_task(_debounced_emit)
+            return
+        if _pending_broadcast["changes"] is not None and ops is not None and version == _pending_broadcast["version"] + 1:
+            _pending_broadcast["changes"].append((ops, notify))
+        else:
+            _pending_broadcast["changes"] = None
+        _pending_broadcast["version"] = version
+
+def find_node(index, node_id):
+    i = index["by_id"].get(node_id)
+    if i is None:
+        return None, None
+    p = index["parent"][i]
+    return index["nodes"][i], index["nodes"][p] if p != -1 else None
+
+def fast_jsonify(obj):
+    return Response(_dumps(obj), mimetype="application/json")
+
+@socketio.on("connect")
+def on_connect():
+    # follow the whole tree until told otherwise; joined before the snapshot is taken so no patch falls in between
+    join_room(_node_room(load_tree()["id"]))
+    # full snapshot on (re)connect; afterwards clients follow along with tree_patch
+    emit("tree_updated", load_tree_payload())
+
+@socketio.on("resync")
+def on_resync():
+    # client saw a tree_patch whose base doesn't match its version
+    emit("tree_updated", load_tree_payload())
+
+@socketio.on("subscribe")
+def on_subscribe(data):
+    """
+    body: { "node_id": "..." }
+    Follow changes at or below node_id; patches for other subtrees aren't sent.
+    A client views one subtree at a time, so earlier subscriptions are dropped.
+    """
+    node_id = (data or {}).get("node_id")
+    # only node rooms: every sid is a room too, and joining one would receive that client's traffic
+    if not isinstance(node_id, str) or node_id not in _load_cached()[1]["by_id"]:
+        return
+    for room in rooms():
+        if room != request.sid:
+            leave_room(room)
+    join_room(_node_room(node_id))
+    # the client's version only covered its old subtree
+    emit("tree_updated", load_tree_payload())
 
 @app.route("/")
 def index():
     return render_template("index.html")
 
+@app.errorhandler(413)
+def too_large(e):
+    return jsonify({"error":"request too large"}), 413
+
+def _title_too_long(title):
+    return isinstance(title, str) and len(title) > MAX_TITLE_LEN
+
 @app.get("/api/tree")
 def api_get_tree():
-    return jsonify(load_tree())
+    body, etag = load_tree_json()
+    headers = {"ETag": f'"{etag}"'}
+    # client already has this version
+    if request.if_none_match.contains(etag):
+        return Response(status=304, headers=headers)
+    return Response(body, mimetype="application/json", headers=headers)
 
 @app.post("/api/node")
 def api_add_node():
@@ -141,22 +788,38 @@ def api_add_node():
     desc = data.get("description", "")
     edge_label = data.get("edgeLabel", "")   # <-- NEW
     new_id = data.get("id") or f"n{os.urandom(4).hex()}"
+    if _title_too_long(title):
+        return jsonify({"error":"title too long"}), 413
 
-    tree = load_tree()
-    parent, _ = find_node(tree, parent_id)
-    if not parent:
-        return jsonify({"error":"parent not found"}), 404
-
-    parent.setdefault("children", []).append({
-        "id": new_id,
-        "title": title,
-        "description": desc,
-        "edgeLabel": edge_label,            # <-- keep it here
-        "children": []
-    })
-    save_tree(tree)
-    socketio.emit("tree_updated", tree)
-    return jsonify({"ok": True, "tree": tree, "newId": new_id})
+    with _mutation_lock:
+        tree, index = load_tree_mut(parent_id)
+        parent, _ = find_node(index, parent_id)
+        if not parent:
+            return jsonify({"error":"parent not found"}), 404
+        if new_id in index["by_id"]:
+            # it would shadow the existing node (lookups find the first one)
+            return jsonify({"error":"id already exists"}), 409
+        if len(index["nodes"]) - index["dead"] >= MAX_NODES:
+            return jsonify({"error":"tree is full"}), 413
+        notify = _ancestor_ids(index, parent_id)
+        if len(notify) >= MAX_DEPTH:
+            return jsonify({"error":"tree too deep"}), 413
+
+        child = {
+            "id": new_id,
+            "title": title,
+            "description": desc,
+            "edgeLabel": edge_label,            # <-- keep it here
+            "children": []
+        }
+        parent.setdefault("children", []).append(child)
+        _index_add(index, index["by_id"][parent_id], child)
+        try:
+            tree = save_tree(tree, index, [{"op": "add", "path": _patch_path(parent_id, "children", "-"), "value": child}],
+                             notify)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 413
+    return fast_jsonify({"ok": True, "tree": tree, "newId": new_id})
 
 @app.put("/api/node/<node_id>")
 def api_edit_node(node_id):
@@ -164,33 +827,51 @@ def api_edit_node(node_id):
     body: { "title": "...", "description": "..." }
     """
     data = request.get_json(force=True) or {}
-    tree = load_tree()
-    node, _ = find_node(tree, node_id)
-    if not node:
-        return jsonify({"error":"node not found"}), 404
+    if _title_too_long(data.get("title")):
+        return jsonify({"error":"title too long"}), 413
 
-    if "title" in data: node["title"] = data["title"]
-    if "description" in data: node["description"] = data["description"]
+    with _mutation_lock:
+        tree, index = load_tree_mut(node_id)
+        node, _ = find_node(index, node_id)
+        if not node:
+            return jsonify({"error":"node not found"}), 404
 
-    save_tree(tree)
-    socketio.emit("tree_updated", tree)
-    return jsonify({"ok": True, "tree": tree})
+        ops = []
+        for field in ("title", "description"):
+            if field in data:
+                node[field] = data[field]
+                ops.append({"op": "replace", "path": _patch_path(node_id, field), "value": data[field]})
+
+        try:
+            tree = save_tree(tree, index, ops, _ancestor_ids(index, node_id))
+        except ValueError as e:
+            # e.g. a rename that merges two subflows
+            return jsonify({"error": str(e)}), 413
+    return fast_jsonify({"ok": True, "tree": tree})
 
 @app.delete("/api/node/<node_id>")
 def api_delete_node(node_id):
-    tree = load_tree()
-    node, parent = find_node(tree, node_id)
-    if not node:
-        return jsonify({"error":"node not found"}), 404
-    if parent is None:
-        return jsonify({"error":"cannot delete root"}), 400
-
-    parent["children"] = [c for c in parent.get("children", []) if c["id"] != node_id]
-    save_tree(tree)
-    socketio.emit("tree_updated", tree)
-    return jsonify({"ok": True, "tree": tree})
+    with _mutation_lock:
+        # clones node_id's parent too, which is what gets mutated
+        tree, index = load_tree_mut(node_id)
+        node, parent = find_node(index, node_id)
+        if not node:
+            return jsonify({"error":"node not found"}), 404
+        if parent is None:
+            return jsonify({"error":"cannot delete root"}), 400
+
+        notify = _ancestor_ids(index, node_id)
+        parent["children"] = [c for c in parent.get("children", []) if c["id"] != node_id]
+        _index_remove(index, index["parent"][index["by_id"][node_id]], node_id)
+        try:
+            tree = save_tree(tree, index, [{"op": "remove", "path": _patch_path(node_id)}], notify)
+        except ValueError as e:
+            # the rebuild re-picks the root, whose expansion can be larger
+            return jsonify({"error": str(e)}), 413
+    return fast_jsonify({"ok": True, "tree": tree})
 
 if __name__ == "__main__":
+    # Development server; see README for running under gunicorn
     # Create default tree if not present
     load_tree()
     socketio.run(app, host="0.0.0.0", port=5000, debug=True)